@@ -1,2 +1,3 @@
 from .depends import Depends
+from .sync_fast import sync_fast
 from .workflow import Workflow
@@ -1,3 +1,4 @@
+import inspect
 from typing import (
     Awaitable,
     Callable,
@@ -14,4 +15,6 @@ class _DependsSentinel:
         self.dependency: Callable[P, Awaitable[T]] = dependency
 
 def Depends(dependency: Callable[P, Awaitable[T]]) -> T:
+    if not inspect.iscoroutinefunction(dependency):
+        raise TypeError(f"Depends() expects an async function, got {dependency!r}")
     return cast(T, _DependsSentinel(dependency))
@@ -0,0 +1,32 @@
+import inspect
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    TypeVar,
+)
+
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+
+
+def sync_fast(fn: F) -> F:
+    """
+    Marks an async function that never suspends (pure CPU work), so `Workflow` runs it
+    inline instead of wrapping it in an `asyncio.Task`.
+    """
+    if not inspect.iscoroutinefunction(fn):
+        raise TypeError(f"sync_fast expects an async function, got {fn!r}")
+    fn._jflow_sync_fast = True
+    return fn
+
+
+def _run_inline(coro: Any) -> Any:
+    """
+    Drives a `sync_fast` coroutine to completion without the event loop.
+    """
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coro.close()
+    raise RuntimeError(f"{coro.__qualname__} is marked sync_fast but suspended")
@@ -1,17 +1,59 @@
 import asyncio
 import inspect
-from collections import defaultdict
+import weakref
 from typing import (
     Any,
     Awaitable,
     Callable,
     Dict,
+    List,
+    Optional,
     Sequence,
     Tuple,
     Union
 )
 
+from .depends import _DependsSentinel
+from .sync_fast import _run_inline
+
 Func = Callable[..., Awaitable[Any]]
+# Calls a fn with its arguments buffer, one slot per parameter in signature order
+Invoker = Callable[[List[Any]], Awaitable[Any]]
+# Marks a cache or argument slot that hasn't got a value yet
+_UNSET: Any = object()
+# ((param name, positional?, dependency fn or None, default), ...) in signature order
+DepPlan = Tuple[Tuple[str, bool, Optional[Func], Any], ...]
+_POSITIONAL = (inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD)
+
+
+# fn -> its DepPlan, keyed weakly so a plan is freed along with its fn
+_dep_plans: "weakref.WeakKeyDictionary[Func, DepPlan]" = weakref.WeakKeyDictionary()
+
+
+def _dep_plan(fn: Func) -> DepPlan:
+    """
+    Describes how each parameter of `fn` gets its value. Memoized across
+    Workflow instances, since a fn's signature doesn't change.
+    """
+    try:
+        return _dep_plans[fn]
+    except (KeyError, TypeError):
+        # TypeError: fn can't be weakly referenced, so it just isn't memoized
+        pass
+    plan = []
+    for param in inspect.signature(fn).parameters.values():
+        default = param.default
+        positional = param.kind in _POSITIONAL
+        if isinstance(default, _DependsSentinel):
+            plan.append((param.name, positional, default.dependency, inspect.Parameter.empty))
+        else:
+            plan.append((param.name, positional, None, default))
+    frozen = tuple(plan)
+    try:
+        _dep_plans[fn] = frozen
+    except TypeError:
+        pass
+    return frozen
 
 
 class Workflow:
@@ -22,81 +64,276 @@ class Workflow:
         self.end_goals = list(end_goals)
         # Build fn -> [its dependency fns]
         self._deps: Dict[Func, Sequence[Func]] = {}
+        # Give every fn a dense integer id, assigned after all of its dependencies,
+        # so ids are in topological order
+        self._fn_to_idx: Dict[Func, int] = {}
+        # Build id -> specialized caller, so running a fn needs no introspection
+        self._invokers: List[Invoker] = []
+        # Build id -> its arguments with defaults filled in; copied by every run
+        self._arg_templates: List[List[Any]] = []
+        # Build id -> [(dependency id, argument slot it fills)]
+        self._arg_deps: List[List[Tuple[int, int]]] = []
+        # Build id -> whether the fn is marked `sync_fast` and can skip the event loop
+        self._sync_fast: List[bool] = []
         for fn in self.end_goals:
             self._build_deps(fn)
-        # Build reverse map fn -> [functions depending on it]
-        self._dependents: Dict[Func, Sequence[Func]] = defaultdict(list)
-        for fn, deps in self._deps.items():
-            for d in deps:
-                self._dependents[d].append(fn)
-
-    def _build_deps(self, fn: Func) -> None:
-        if fn in self._deps:
-            return
-        sig = inspect.signature(fn)
-        deps = []
-        for param in sig.parameters.values():
-            default = param.default
-            if hasattr(default, "dependency") and inspect.iscoroutinefunction(default.dependency):
-                dep_fn = default.dependency
-                deps.append(dep_fn)
-                self._build_deps(dep_fn)
-        self._deps[fn] = deps
+        self._fns: Tuple[Func, ...] = tuple(self._deps)
+        # Build reverse map id -> [(dependent id, argument slot)] in CSR form: the
+        # dependents of fn i are _dep_targets[_dep_offsets[i]:_dep_offsets[i + 1]],
+        # and each gets fn i's result in the matching entry of _dep_slots
+        dependents: List[List[Tuple[int, int]]] = [[] for _ in self._fns]
+        for i, arg_deps in enumerate(self._arg_deps):
+            for d, slot in arg_deps:
+                dependents[d].append((i, slot))
+        self._dep_offsets: List[int] = [0]
+        self._dep_targets: List[int] = []
+        self._dep_slots: List[int] = []
+        for edges in dependents:
+            for child, slot in edges:
+                self._dep_targets.append(child)
+                self._dep_slots.append(slot)
+            self._dep_offsets.append(len(self._dep_targets))
+        # Static count of dependencies per id; copied and decremented by every run
+        self._in_degree: List[int] = [len(arg_deps) for arg_deps in self._arg_deps]
+        # Group fns by longest distance from a root; fns within a layer are independent
+        self._layers: List[Tuple[int, ...]] = self._build_layers()
+        # If every fn depends on the entire layer before it, nothing can start before its
+        # layer does anyway, so running layer by layer costs no pipelining
+        self._layered = all(
+            set(prev).issubset(d for d, _ in self._arg_deps[i])
+            for prev, layer in zip(self._layers, self._layers[1:])
+            for i in layer
+        )
+        self._goal_ids: Tuple[int, ...] = tuple(self._fn_to_idx[fn] for fn in self.end_goals)
 
-    async def run(self, entry_points: Dict[Func, Any]) -> Tuple[Any, ...]:
-        # 1) Seed cache with entry points
-        entry_point_results = await asyncio.gather(*[fn(*args) for fn, args in entry_points.items()])
-        cache: Dict[Func, Any] = {}
-        for (fn, args), res in zip(entry_points.items(), entry_point_results):
-            cache[fn] = res
-
-        # 2) Count unmet dependencies for every fn
-        rem_deps: Dict[Func, int] = {
-            fn: sum(1 for d in deps if d not in cache)
-            for fn, deps in self._deps.items()
-        }
-
-        # 3) Kick off all ready tasks
-        running: Dict[Func, asyncio.Task] = {}
-        for fn, count in rem_deps.items():
-            if count == 0 and fn not in cache:
-                running[fn] = asyncio.create_task(self._execute(fn, cache))
-
-        # 4) As tasks complete, schedule dependents
-        while running:
-            done, _ = await asyncio.wait(
-                running.values(), return_when=asyncio.FIRST_COMPLETED
-            )
-            for task in done:
-                # find which fn finished
-                finished_fn = next(f for f, t in running.items() if t is task)
-                running.pop(finished_fn)
-                result = task.result()
-                cache[finished_fn] = result
-                # decrement deps of its dependents
-                for child in self._dependents.get(finished_fn, []):
+    def _build_deps(self, goal: Func) -> None:
+        """
+        Iterative post-order DFS from `goal`, so a fn is only registered once all of
+        its dependencies are, no matter how deep the DAG is. Raises on cycles, so
+        `run` can always assume a valid DAG.
+        """
+        visited = set()
+        stack: List[Tuple[Func, bool]] = [(goal, False)]
+        while stack:
+            fn, expanded = stack.pop()
+            if fn in self._deps:
+                continue
+            if not expanded:
+                if fn in visited:
+                    # Seen but not registered yet: fn is one of its own dependencies
+                    path = [f for f, on_path in stack if on_path]
+                    cycle = path[path.index(fn):] + [fn]
+                    raise RuntimeError(
+                        "Dependency cycle: " + " -> ".join(f.__name__ for f in cycle)
+                    )
+                visited.add(fn)
+                # Revisit fn once everything pushed after it has been registered
+                stack.append((fn, True))
+                stack.extend(
+                    (dep_fn, False) for _, _, dep_fn, _ in _dep_plan(fn)
+                    if dep_fn is not None and dep_fn not in self._deps
+                )
+                continue
+            template: List[Any] = []
+            arg_deps: List[Tuple[int, int]] = []
+            kw_names: List[str] = []
+            missing: List[str] = []
+            deps: List[Func] = []
+            for slot, (name, positional, dep_fn, default) in enumerate(_dep_plan(fn)):
+                if dep_fn is not None:
+                    deps.append(dep_fn)
+                    arg_deps.append((self._fn_to_idx[dep_fn], slot))
+                    template.append(_UNSET)
+                else:
+                    if default is inspect.Parameter.empty:
+                        missing.append(name)
+                    template.append(default)
+                if not positional:
+                    kw_names.append(name)
+            self._deps[fn] = deps
+            self._fn_to_idx[fn] = len(self._invokers)
+            self._invokers.append(self._build_invoker(fn, len(template) - len(kw_names), kw_names, missing))
+            self._arg_templates.append(template)
+            self._arg_deps.append(arg_deps)
+            self._sync_fast.append(getattr(fn, "_jflow_sync_fast", False))
+
+    @staticmethod
+    def _build_invoker(fn: Func, n_positional: int, kw_names: Sequence[str],
+                       missing: Sequence[str]) -> Invoker:
+        """
+        Specializes a caller for `fn` that passes its arguments buffer positionally,
+        except for the trailing keyword-only parameters.
+        """
+        if missing:
+            async def _fail(args: List[Any]) -> Any:
+                raise RuntimeError(f"Missing required parameter {missing[0]!r} for {fn.__name__}")
+            return _fail
+        if not kw_names:
+            return lambda args: fn(*args)
+        names = tuple(kw_names)
+        return lambda args: fn(*args[:n_positional], **dict(zip(names, args[n_positional:])))
+
+    def _build_layers(self) -> List[Tuple[int, ...]]:
+        """
+        Kahn's algorithm, peeling off all currently dependency-free fns as one layer.
+        """
+        offsets, targets = self._dep_offsets, self._dep_targets
+        rem_deps = self._in_degree.copy()
+        layer = [i for i, count in enumerate(rem_deps) if count == 0]
+        layers = []
+        while layer:
+            layers.append(tuple(layer))
+            next_layer = []
+            for i in layer:
+                for j in range(offsets[i], offsets[i + 1]):
+                    child = targets[j]
                     rem_deps[child] -= 1
                     if rem_deps[child] == 0:
-                        running[child] = asyncio.create_task(self._execute(child, cache))
+                        next_layer.append(child)
+            layer = next_layer
+        return layers
 
-        # 5) Collect and return end‐goal results in order
-        return tuple(cache[fn] for fn in self.end_goals)
+    async def run(self, entry_points: Dict[Func, Any]) -> Tuple[Any, ...]:
+        # 1) Call entry points; results that are ready now seed the cache, the rest
+        #    get awaited as part of the DAG so their dependents start right after them
+        cache: List[Any] = [_UNSET] * len(self._fns)
+        seeded: List[int] = []
+        started: Dict[int, Awaitable[Any]] = {}
+        stray: List[asyncio.Future] = []
+        try:
+            for fn, args in entry_points.items():
+                val = fn(*args)
+                i = self._fn_to_idx.get(fn)
+                if isinstance(val, asyncio.Future) and val.done():
+                    val = val.result()
+                elif hasattr(type(val), "__await__"):
+                    if i is None:
+                        # Not part of the DAG, but still runs alongside it
+                        stray.append(asyncio.ensure_future(val))
+                    else:
+                        started[i] = val
+                    continue
+                # A plain function returned its value directly
+                if i is not None:
+                    cache[i] = val
+                    seeded.append(i)
 
-    @staticmethod
-    async def _execute(fn: Func, cache: Dict[Func, Any]) -> Any:
+            # 2) Execute everything else, then collect end-goal results in order
+            args = [template.copy() for template in self._arg_templates]
+            offsets, targets, slots = self._dep_offsets, self._dep_targets, self._dep_slots
+            for i in seeded:
+                for j in range(offsets[i], offsets[i + 1]):
+                    args[targets[j]][slots[j]] = cache[i]
+            if self._layered and all(not self._in_degree[i] for i in (*seeded, *started)):
+                await self._run_layers(cache, args, started)
+            else:
+                await self._run_pipelined(cache, args, seeded, started)
+            for fut in stray:
+                await fut
+        finally:
+            # If the DAG raised, don't leave entry points that never got to run unawaited
+            for val in started.values():
+                if inspect.iscoroutine(val):
+                    val.close()
+                elif isinstance(val, asyncio.Future):
+                    val.cancel()
+            for fut in stray:
+                fut.cancel()
+        return tuple(cache[i] for i in self._goal_ids)
+
+    async def _run_layers(self, cache: List[Any], args: List[List[Any]],
+                          started: Dict[int, Awaitable[Any]]) -> None:
         """
-        Gathers kwargs for `fn` from cache (via Depends) or defaults,
-        then awaits it.
+        Runs one `asyncio.gather` per layer. Only used when the DAG is strictly layered
+        and all entry points are roots, i.e. when it can't delay any fn.
         """
-        sig = inspect.signature(fn)
-        kwargs: Dict[str, Any] = {}
-        for param in sig.parameters.values():
-            default = param.default
-            if hasattr(default, "dependency") and inspect.iscoroutinefunction(default.dependency):
-                dep_fn = default.dependency
-                kwargs[param.name] = cache[dep_fn]
-            elif default is not inspect._empty:
-                kwargs[param.name] = default
-            else:
-                raise RuntimeError(f"Missing required parameter {param.name!r} for {fn.__name__}")
-        return await fn(**kwargs)
+        invokers, sync_fast = self._invokers, self._sync_fast
+        offsets, targets, slots = self._dep_offsets, self._dep_targets, self._dep_slots
+
+        def complete(i: int, result: Any) -> None:
+            cache[i] = result
+            # hand the result straight to the argument slots of its dependents
+            for j in range(offsets[i], offsets[i + 1]):
+                args[targets[j]][slots[j]] = result
+
+        for layer in self._layers:
+            todo = []
+            inline = []
+            for i in layer:
+                if cache[i] is not _UNSET:
+                    continue
+                if sync_fast[i] and i not in started:
+                    inline.append(i)
+                else:
+                    todo.append(i)
+            # Start the layer's tasks before any inline fn gets a chance to raise
+            gathering = asyncio.gather(
+                *[started.pop(i) if i in started else invokers[i](args[i]) for i in todo]
+            )
+            for i in inline:
+                complete(i, _run_inline(invokers[i](args[i])))
+            for i, res in zip(todo, await gathering):
+                complete(i, res)
+
+    async def _run_pipelined(self, cache: List[Any], args: List[List[Any]], seeded: List[int],
+                             started: Dict[int, Awaitable[Any]]) -> None:
+        """
+        Starts every fn as soon as its last dependency finishes.
+        """
+        invokers, sync_fast = self._invokers, self._sync_fast
+        offsets, targets, slots = self._dep_offsets, self._dep_targets, self._dep_slots
+
+        # 1) Count unmet dependencies for every fn. Entry points never count down to
+        #    zero, so finishing their own dependencies doesn't run them a second time
+        rem_deps = self._in_degree.copy()
+        for i in (*seeded, *started):
+            rem_deps[i] = -1
+        for i in seeded:
+            for j in range(offsets[i], offsets[i + 1]):
+                rem_deps[targets[j]] -= 1
+
+        # 2) Run ready fns; each task reports back through `done` when finished
+        done: asyncio.Queue[Tuple[int, asyncio.Future]] = asyncio.Queue()
+        pending = 0
+        ready: List[int] = []
+        # `sync_fast` fns ready to run inline
+        ready_inline: List[int] = []
+        for i, count in enumerate(rem_deps):
+            if count == 0:
+                (ready_inline if sync_fast[i] else ready).append(i)
+        ready.extend(started)
+
+        def complete(i: int, result: Any) -> None:
+            cache[i] = result
+            # hand the result to the argument slots of its dependents as their
+            # remaining deps get decremented
+            for j in range(offsets[i], offsets[i + 1]):
+                child = targets[j]
+                args[child][slots[j]] = result
+                rem_deps[child] -= 1
+                if rem_deps[child] == 0:
+                    (ready_inline if sync_fast[child] else ready).append(child)
+
+        while True:
+            # Start tasks (entry points included) before any inline fn gets a chance to raise
+            for i in ready:
+                fut = asyncio.ensure_future(started.pop(i) if i in started else invokers[i](args[i]))
+                fut.add_done_callback(lambda f, i=i: done.put_nowait((i, f)))
+            pending += len(ready)
+            ready.clear()
+            while ready_inline:
+                i = ready_inline.pop()
+                complete(i, _run_inline(invokers[i](args[i])))
+            if ready:
+                continue
+            if not pending:
+                break
+            # 3) As tasks complete, collect newly ready dependents. Every completion
+            #    already queued is handled first, so the fns they free up start as one batch
+            i, fut = await done.get()
+            pending -= 1
+            complete(i, fut.result())
+            while not done.empty():
+                i, fut = done.get_nowait()
+                pending -= 1
+                complete(i, fut.result())
@@ -0,0 +1,136 @@
+import asyncio
+import contextvars
+import gc
+import unittest
+import weakref
+
+from jflow import Depends, Workflow, sync_fast
+
+
+async def create_person(person_name: str) -> dict:
+    return {'name': person_name}
+
+
+class TestDepends(unittest.TestCase):
+    def test_rejects_non_async_dependency(self):
+        def not_async():
+            return 1
+
+        with self.assertRaises(TypeError):
+            Depends(not_async)
+
+
+class TestWorkflow(unittest.IsolatedAsyncioTestCase):
+    async def test_rejects_dependency_cycle(self):
+        async def a(x=None):
+            return x
+
+        async def b(y=Depends(a)):
+            return y
+
+        a.__defaults__ = (Depends(b),)
+        with self.assertRaisesRegex(RuntimeError, "Dependency cycle: b -> a -> b"):
+            Workflow(b)
+
+    async def test_sync_fast_returns_value(self):
+        @sync_fast
+        async def greet(p=Depends(create_person)) -> str:
+            return 'Hi ' + p['name']
+
+        result, = await Workflow(greet).run(entry_points={create_person: ['Joe']})
+        self.assertEqual(result, 'Hi Joe')
+
+    async def test_sync_fast_raises_when_suspended(self):
+        @sync_fast
+        async def sleepy(p=Depends(create_person)) -> str:
+            await asyncio.sleep(0.01)
+            return p['name']
+
+        with self.assertRaisesRegex(RuntimeError, "sleepy is marked sync_fast but suspended"):
+            await Workflow(sleepy).run(entry_points={create_person: ['Joe']})
+
+    async def test_tasks_go_through_loop_task_factory(self):
+        async def root() -> int:
+            return 1
+
+        async def left(x=Depends(root)) -> int:
+            return x + 1
+
+        async def right(x=Depends(root)) -> int:
+            return x + 2
+
+        async def join(a=Depends(left), b=Depends(right)) -> int:
+            return a * b
+
+        created = []
+        loop = asyncio.get_running_loop()
+
+        def factory(loop, coro, **kwargs):
+            created.append(coro.__qualname__.rsplit('.', 1)[-1])
+            return asyncio.Task(coro, loop=loop, **kwargs)
+
+        loop.set_task_factory(factory)
+        try:
+            result, = await Workflow(join).run(entry_points={})
+        finally:
+            loop.set_task_factory(None)
+        self.assertEqual(result, 6)
+        self.assertIn('left', created)
+        self.assertIn('right', created)
+
+    async def test_context_changes_stay_inside_their_task(self):
+        var = contextvars.ContextVar('var', default='unset')
+
+        async def setter() -> None:
+            var.set('set-by-setter')
+
+        async def reader(_=Depends(setter)) -> str:
+            return var.get()
+
+        var.set('caller')
+        result, = await Workflow(reader).run(entry_points={})
+        self.assertEqual(result, 'caller')
+        self.assertEqual(var.get(), 'caller')
+
+    async def test_entry_points_run_when_sync_fast_root_raises(self):
+        ran = []
+
+        async def entry() -> int:
+            ran.append('entry')
+            return 1
+
+        @sync_fast
+        async def failing() -> int:
+            raise ValueError('boom')
+
+        async def join(a=Depends(entry), b=Depends(failing)) -> int:
+            return a + b
+
+        async def only_entry(a=Depends(entry)) -> int:
+            return a
+
+        # Strictly layered, then pipelined
+        for workflow in (Workflow(join), Workflow(join, only_entry)):
+            ran.clear()
+            with self.assertRaisesRegex(ValueError, 'boom'):
+                await workflow.run(entry_points={entry: []})
+            await asyncio.sleep(0)
+            self.assertEqual(ran, ['entry'])
+
+    async def test_dependency_plans_are_freed_with_their_functions(self):
+        def make_task():
+            async def task(p=Depends(create_person)) -> str:
+                return p['name']
+            return task
+
+        task = make_task()
+        result, = await Workflow(task).run(entry_points={create_person: ['Joe']})
+        self.assertEqual(result, 'Joe')
+        ref = weakref.ref(task)
+        del task
+        gc.collect()
+        self.assertIsNone(ref())
+
+
+if __name__ == '__main__':
+    unittest.main()